@@ -5,30 +5,92 @@ Provides advanced threat detection, anomaly detection, and security monitoring
 
 import numpy as np
 import pandas as pd
-from datetime import datetime, timedelta
+from datetime import datetime
 from typing import Dict, List, Optional, Tuple, Any
 import logging
-import json
 from dataclasses import dataclass
-from enum import Enum
+from enum import Enum, IntEnum
 import hashlib
 import hmac
 import secrets
 from cryptography.fernet import Fernet
-import redis
+from redis import asyncio as aioredis
 import asyncio
+import functools
+import threading
 from concurrent.futures import ThreadPoolExecutor
-import tensorflow as tf
 from sklearn.ensemble import IsolationForest
 from sklearn.preprocessing import StandardScaler
 import joblib
 import os
+import re
+import struct
+
+try:
+    import hyperscan
+except ImportError:
+    hyperscan = None
+
+try:
+    import blake3
+except ImportError:
+    blake3 = None
+
+try:
+    import onnxruntime
+    from skl2onnx import convert_sklearn
+    from skl2onnx.common.data_types import FloatTensorType
+except ImportError:
+    onnxruntime = None
+
+# Categories matched with regexes (headers are checked separately)
+REGEX_PATTERN_CATEGORIES = ('sql_injection', 'xss_patterns', 'path_traversal')
+
+# Increment the IP and session counters, starting a 60 second window on first use
+RATE_LIMIT_SCRIPT = """
+local ip_requests = redis.call('INCR', KEYS[1])
+if ip_requests == 1 then redis.call('EXPIRE', KEYS[1], 60) end
+local session_requests = redis.call('INCR', KEYS[2])
+if session_requests == 1 then redis.call('EXPIRE', KEYS[2], 60) end
+return {ip_requests, session_requests}
+"""
+
+# Cached ML predictions: anomalous flag and decision score, kept for 5 minutes
+ML_CACHE_RECORD = struct.Struct('<?f')
+ML_CACHE_TTL = 300
+
+# Method encoding for ML features; unknown methods map to 5
+METHOD_LUT = {'GET': 0, 'POST': 1, 'PUT': 2, 'DELETE': 3, 'PATCH': 4}
+FEATURE_COUNT = 10
+
+# Deletes the special characters counted as an ML feature
+_SPECIAL_TBL = str.maketrans('', '', '<>"\'&%')
+
+# Number of recent requests kept per user or IP for behavioral analysis
+BEHAVIOR_HISTORY_SIZE = 100
+
+# Opsets for the exported isolation forest (TreeEnsemble ops need ai.onnx.ml <= 3)
+ONNX_TARGET_OPSET = {'': 17, 'ai.onnx.ml': 3}
+
+# Requests arriving within the window are scored in one batch of at most ML_BATCH_SIZE
+ML_BATCH_SIZE = 64
+ML_BATCH_WINDOW = 0.005
 
-class ThreatLevel(Enum):
-    LOW = "low"
-    MEDIUM = "medium"
-    HIGH = "high"
-    CRITICAL = "critical"
+# Session IDs are carved from a pooled block of OS randomness
+SESSION_ID_BYTES = 16
+SESSION_ID_POOL_SIZE = 4096
+
+# Redis hash holding the shared security metric counters
+METRICS_KEY = 'security:metrics'
+
+_SCRIPT_RE = re.compile(r'script', re.IGNORECASE)
+_BOT_RE = re.compile(r'bot', re.IGNORECASE)
+
+class ThreatLevel(IntEnum):
+    LOW = 0
+    MEDIUM = 1
+    HIGH = 2
+    CRITICAL = 3
 
 class AnomalyType(Enum):
     BEHAVIORAL = "behavioral"
@@ -51,24 +113,54 @@ class DetectionResult:
     recommendation: str
     evidence: List[str]
 
-@dataclass
 class SecurityMetrics:
     """Security metrics for monitoring"""
-    total_requests: int = 0
-    suspicious_requests: int = 0
-    blocked_requests: int = 0
-    average_response_time: float = 0.0
-    error_rate: float = 0.0
-    unique_ips: int = 0
-    failed_logins: int = 0
-    successful_logins: int = 0
+    __slots__ = (
+        'total_requests', 'suspicious_requests', 'blocked_requests', 'average_response_time',
+        'error_rate', 'unique_ips', 'failed_logins', 'successful_logins'
+    )
+
+    def __init__(self, total_requests: int = 0, suspicious_requests: int = 0, blocked_requests: int = 0,
+                 average_response_time: float = 0.0, error_rate: float = 0.0, unique_ips: int = 0,
+                 failed_logins: int = 0, successful_logins: int = 0):
+        self.total_requests = total_requests
+        self.suspicious_requests = suspicious_requests
+        self.blocked_requests = blocked_requests
+        self.average_response_time = average_response_time
+        self.error_rate = error_rate
+        self.unique_ips = unique_ips
+        self.failed_logins = failed_logins
+        self.successful_logins = successful_logins
+
+    @classmethod
+    def from_counters(cls, counters: Dict[Any, Any], unique_ips: int) -> 'SecurityMetrics':
+        """Build a metrics snapshot from the shared Redis hash counters"""
+        counters = {key.decode() if isinstance(key, bytes) else key: value for key, value in counters.items()}
+        total_requests = int(counters.get('total_requests', 0))
+        response_time_total = float(counters.get('response_time_total', 0.0))
+
+        return cls(
+            total_requests=total_requests,
+            suspicious_requests=int(counters.get('suspicious_requests', 0)),
+            blocked_requests=int(counters.get('blocked_requests', 0)),
+            average_response_time=response_time_total / total_requests if total_requests else 0.0,
+            error_rate=float(counters.get('error_rate', 0.0)),
+            unique_ips=unique_ips,
+            failed_logins=int(counters.get('failed_logins', 0)),
+            successful_logins=int(counters.get('successful_logins', 0))
+        )
 
 class EnhancedDetection:
     """Enhanced detection system with ML-based anomaly detection"""
 
-    def __init__(self, redis_client: redis.Redis = None):
+    def __init__(self, redis_client: aioredis.Redis = None):
         self.logger = logging.getLogger(__name__)
-        self.redis_client = redis_client or redis.Redis(host='localhost', port=6379, db=0)
+        self.redis_client = redis_client or aioredis.Redis(
+            connection_pool=aioredis.BlockingConnectionPool(
+                host='localhost', port=6379, db=0, max_connections=64, timeout=1
+            )
+        )
+        self._rate_script = self.redis_client.register_script(RATE_LIMIT_SCRIPT)
 
         # Initialize ML models
         self._initialize_ml_models()
@@ -77,14 +169,25 @@ class EnhancedDetection:
         self.max_requests_per_minute = 1000
         self.max_failed_logins = 5
         self.suspicious_patterns = self._load_suspicious_patterns()
+        self._hs_dbs = self._compile_hyperscan_databases()
+        self._pattern_prefilters = self._compile_pattern_prefilters()
         self.encryption_key = os.getenv('ENCRYPTION_KEY', Fernet.generate_key())
         self.cipher = Fernet(self.encryption_key)
 
         # Metrics storage
         self.metrics = SecurityMetrics()
 
-        # Thread pool for async operations
-        self.executor = ThreadPoolExecutor(max_workers=4)
+        # Random bytes for session IDs, refilled when exhausted
+        self._session_id_pool = b''
+        self._session_id_offset = 0
+
+        # Thread pool for ML inference, keeps model scoring off the event loop
+        self.executor = ThreadPoolExecutor(max_workers=os.cpu_count())
+        self._tls = threading.local()
+
+        # Batched ML scoring, started on first use inside the running event loop
+        self._ml_queue: Optional[asyncio.Queue] = None
+        self._ml_worker: Optional[asyncio.Task] = None
 
     def _initialize_ml_models(self):
         """Initialize machine learning models for anomaly detection"""
@@ -110,14 +213,49 @@ class EnhancedDetection:
                 joblib.dump(self.isolation_forest, f'{model_path}/isolation_forest.pkl')
                 joblib.dump(self.scaler, f'{model_path}/scaler.pkl')
 
+            # Scaler parameters for inline standardization at inference time
+            self._scaler_mean = self.scaler.mean_.astype(np.float32)
+            self._scaler_scale = self.scaler.scale_.astype(np.float32)
+
+            # Serve the forest through onnxruntime when available
+            self._ort_session = self._load_onnx_model(model_path)
+
         except Exception as e:
             self.logger.warning(f"Failed to initialize ML models: {e}")
             self.isolation_forest = None
             self.scaler = None
+            self._ort_session = None
+
+    def _load_onnx_model(self, model_path: str):
+        """Export the isolation forest to ONNX and open an onnxruntime session for it"""
+        if onnxruntime is None:
+            return None
+
+        try:
+            onnx_model = convert_sklearn(
+                self.isolation_forest,
+                initial_types=[('X', FloatTensorType([None, FEATURE_COUNT]))],
+                target_opset=ONNX_TARGET_OPSET
+            )
+            serialized_model = onnx_model.SerializeToString()
+            session = onnxruntime.InferenceSession(serialized_model, providers=['CPUExecutionProvider'])
+
+        except Exception as e:
+            self.logger.warning(f"Failed to load ONNX model, using scikit-learn: {e}")
+            return None
+
+        # The session runs from memory; saving the export is best effort (the directory may be read-only)
+        try:
+            with open(f'{model_path}/isolation_forest.onnx', 'wb') as f:
+                f.write(serialized_model)
+        except OSError as e:
+            self.logger.warning(f"Failed to save ONNX model: {e}")
+
+        return session
 
     def _load_suspicious_patterns(self) -> Dict[str, Any]:
         """Load suspicious patterns from configuration"""
-        return {
+        patterns = {
             'sql_injection': [
                 r'(\bselect\b|\bunion\b|\binsert\b|\bupdate\b|\bdelete\b|\bdrop\b)',
                 r'(\bor\s+\d+\s*=\s*\d+|\band\s+\d+\s*=\s*\d+)',
@@ -143,19 +281,80 @@ class EnhancedDetection:
             ]
         }
 
+        # Compile regex categories once; matching is case-insensitive so inputs are never lowercased
+        for category in REGEX_PATTERN_CATEGORIES:
+            patterns[category] = [re.compile(pattern, re.IGNORECASE) for pattern in patterns[category]]
+
+        return patterns
+
+    def _compile_hyperscan_databases(self) -> Dict[str, Any]:
+        """Compile each regex category into a single Hyperscan database"""
+        if hyperscan is None:
+            return {}
+
+        try:
+            databases = {}
+            for category in REGEX_PATTERN_CATEGORIES:
+                patterns = self.suspicious_patterns[category]
+                database = hyperscan.Database()
+                database.compile(
+                    expressions=[pattern.pattern.encode() for pattern in patterns],
+                    ids=list(range(len(patterns))),
+                    flags=[hyperscan.HS_FLAG_CASELESS | hyperscan.HS_FLAG_SINGLEMATCH] * len(patterns)
+                )
+                databases[category] = database
+            return databases
+
+        except Exception as e:
+            self.logger.warning(f"Failed to compile Hyperscan databases, falling back to re: {e}")
+            return {}
+
+    def _compile_pattern_prefilters(self) -> Dict[str, re.Pattern]:
+        """Combine each regex category into one alternation used to skip clean text in a single scan"""
+        return {
+            category: re.compile(
+                '|'.join(f'(?:{pattern.pattern})' for pattern in self.suspicious_patterns[category]),
+                re.IGNORECASE
+            )
+            for category in REGEX_PATTERN_CATEGORIES
+        }
+
+    def _match_patterns(self, category: str, *texts: str) -> List[str]:
+        """Return the patterns of a category that match any of the given texts"""
+        patterns = self.suspicious_patterns[category]
+        database = self._hs_dbs.get(category)
+        matched_ids = set()
+
+        def on_match(pattern_id, start, end, flags, context):
+            matched_ids.add(pattern_id)
+
+        # Each text is scanned on its own so no pattern can match across the path/body boundary
+        for text in texts:
+            # Hyperscan's \b works on bytes and treats non-ASCII letters as boundaries, unlike re on str
+            if database is not None and text.isascii():
+                database.scan(text.encode('ascii'), match_event_handler=on_match)
+            elif self._pattern_prefilters[category].search(text):
+                # Attribute the hit to individual patterns only when the combined scan matched
+                matched_ids.update(
+                    pattern_id for pattern_id, pattern in enumerate(patterns) if pattern.search(text)
+                )
+
+        return [patterns[pattern_id].pattern for pattern_id in sorted(matched_ids)]
+
     async def analyze_request(self, request_data: Dict[str, Any]) -> DetectionResult:
         """Analyze a request for potential threats"""
         try:
             # Extract request information
             source_ip = request_data.get('ip', 'unknown')
             user_id = request_data.get('user_id')
-            session_id = request_data.get('session_id', self._generate_session_id())
+            session_id = request_data.get('session_id') or self._generate_session_id()
             user_agent = request_data.get('user_agent', '')
             path = request_data.get('path', '')
             method = request_data.get('method', '')
             headers = request_data.get('headers', {})
             body = request_data.get('body', '')
-            timestamp = request_data.get('timestamp', datetime.now())
+            # Single clock read per request, shared by every analysis step
+            timestamp = request_data.get('timestamp') or datetime.now()
 
             # Initialize detection results
             threat_level = ThreatLevel.LOW
@@ -169,7 +368,10 @@ class EnhancedDetection:
             if rate_limit_result['blocked']:
                 threat_level = ThreatLevel.HIGH
                 confidence = 0.9
-                evidence.append(f"Rate limit exceeded: {rate_limit_result['requests']} requests/minute")
+                evidence.append(
+                    f"Rate limit exceeded: {rate_limit_result['ip_requests']} IP / "
+                    f"{rate_limit_result['session_requests']} session requests/minute"
+                )
                 details['rate_limit'] = rate_limit_result
 
             # 2. Pattern-based detection
@@ -181,7 +383,7 @@ class EnhancedDetection:
                 details['pattern_detection'] = pattern_results
 
             # 3. Behavioral analysis
-            behavioral_result = await self._analyze_behavior(source_ip, user_id, session_id, path, method)
+            behavioral_result = await self._analyze_behavior(source_ip, user_id, session_id, path, method, timestamp)
             if behavioral_result['anomalous']:
                 threat_level = max(threat_level, ThreatLevel.MEDIUM)
                 confidence = max(confidence, behavioral_result['confidence'])
@@ -190,7 +392,7 @@ class EnhancedDetection:
 
             # 4. ML-based anomaly detection
             if self.isolation_forest and self.scaler:
-                ml_result = self._ml_anomaly_detection(request_data)
+                ml_result = await self._ml_anomaly_detection(request_data, timestamp)
                 if ml_result['anomalous']:
                     threat_level = max(threat_level, ThreatLevel.HIGH)
                     confidence = max(confidence, ml_result['confidence'])
@@ -244,6 +446,10 @@ class EnhancedDetection:
                 evidence=[f'Analysis error: {str(e)}']
             )
 
+    async def analyze_requests(self, batch: List[Dict[str, Any]]) -> List[DetectionResult]:
+        """Analyze several requests concurrently so their ML scoring is batched"""
+        return list(await asyncio.gather(*(self.analyze_request(request_data) for request_data in batch)))
+
     async def _check_rate_limit(self, ip: str, session_id: str) -> Dict[str, Any]:
         """Check if request exceeds rate limits"""
         try:
@@ -251,16 +457,8 @@ class EnhancedDetection:
             ip_key = f"rate_limit:ip:{ip}"
             session_key = f"rate_limit:session:{session_id}"
 
-            current_time = datetime.now()
-            window_start = current_time - timedelta(minutes=1)
-
-            # Get request counts
-            ip_requests = await self._get_request_count(ip_key, window_start)
-            session_requests = await self._get_request_count(session_key, window_start)
-
-            # Update counters
-            await self._increment_request_count(ip_key)
-            await self._increment_request_count(session_key)
+            # Increment both counters atomically in a single round trip
+            ip_requests, session_requests = await self._rate_script(keys=[ip_key, session_key])
 
             # Check limits
             blocked = False
@@ -286,62 +484,37 @@ class EnhancedDetection:
             self.logger.error(f"Rate limit check error: {e}")
             return {'blocked': False, 'error': str(e)}
 
-    async def _get_request_count(self, key: str, window_start: datetime) -> int:
-        """Get request count for a key within time window"""
-        try:
-            # In a real implementation, use Redis sorted sets for time windows
-            count = self.redis_client.get(key)
-            return int(count) if count else 0
-        except Exception:
-            return 0
-
-    async def _increment_request_count(self, key: str):
-        """Increment request count for a key"""
-        try:
-            # Use Redis increment with expiration
-            self.redis_client.incr(key)
-            self.redis_client.expire(key, 60)  # Expire after 60 seconds
-        except Exception as e:
-            self.logger.error(f"Error incrementing request count: {e}")
-
     def _detect_suspicious_patterns(self, path: str, body: str, headers: Dict, user_agent: str) -> Dict[str, Any]:
         """Detect suspicious patterns in request data"""
-        import re
-
         detected_patterns = []
         detected = False
 
         # Check SQL injection patterns
-        for pattern in self.suspicious_patterns['sql_injection']:
-            if re.search(pattern, path.lower(), re.IGNORECASE) or \
-               re.search(pattern, body.lower(), re.IGNORECASE):
-                detected_patterns.append(f"SQL injection pattern: {pattern}")
-                detected = True
+        for pattern in self._match_patterns('sql_injection', path, body):
+            detected_patterns.append(f"SQL injection pattern: {pattern}")
+            detected = True
 
         # Check XSS patterns
-        for pattern in self.suspicious_patterns['xss_patterns']:
-            if re.search(pattern, path.lower(), re.IGNORECASE) or \
-               re.search(pattern, body.lower(), re.IGNORECASE):
-                detected_patterns.append(f"XSS pattern: {pattern}")
-                detected = True
+        for pattern in self._match_patterns('xss_patterns', path, body):
+            detected_patterns.append(f"XSS pattern: {pattern}")
+            detected = True
 
         # Check path traversal
-        for pattern in self.suspicious_patterns['path_traversal']:
-            if re.search(pattern, path.lower(), re.IGNORECASE):
-                detected_patterns.append(f"Path traversal pattern: {pattern}")
-                detected = True
+        for pattern in self._match_patterns('path_traversal', path):
+            detected_patterns.append(f"Path traversal pattern: {pattern}")
+            detected = True
 
         # Check suspicious headers
         for header in self.suspicious_patterns['suspicious_headers']:
             if header in headers:
                 header_value = headers[header]
-                if len(header_value) > 1000 or 'script' in header_value.lower():
+                if len(header_value) > 1000 or _SCRIPT_RE.search(header_value):
                     detected_patterns.append(f"Suspicious header {header}: {header_value[:100]}...")
                     detected = True
 
         # Check user agent
         if user_agent:
-            if len(user_agent) > 500 or 'bot' in user_agent.lower():
+            if len(user_agent) > 500 or _BOT_RE.search(user_agent):
                 detected_patterns.append(f"Suspicious user agent: {user_agent[:100]}...")
                 detected = True
 
@@ -351,31 +524,29 @@ class EnhancedDetection:
             'total_patterns': len(detected_patterns)
         }
 
-    async def _analyze_behavior(self, ip: str, user_id: str, session_id: str, path: str, method: str) -> Dict[str, Any]:
+    async def _analyze_behavior(self, ip: str, user_id: str, session_id: str, path: str, method: str,
+                                now: datetime) -> Dict[str, Any]:
         """Analyze user behavior for anomalies"""
         try:
-            # Get user behavior history
+            # Behavior history is kept as capped Redis lists, newest entry first
             behavior_key = f"behavior:{user_id or ip}"
-            behavior_data = self.redis_client.get(behavior_key)
-
-            if behavior_data:
-                behavior_history = json.loads(behavior_data)
-            else:
-                behavior_history = {
-                    'paths': [],
-                    'methods': [],
-                    'timestamps': [],
-                    'response_times': []
-                }
-
-            # Update behavior history
-            behavior_history['paths'].append(path)
-            behavior_history['methods'].append(method)
-            behavior_history['timestamps'].append(datetime.now().isoformat())
-
-            # Keep only last 100 entries
-            for key in behavior_history:
-                behavior_history[key] = behavior_history[key][-100:]
+            path_ids_key = f"{behavior_key}:path_ids"
+            methods_key = f"{behavior_key}:methods"
+            timestamps_key = f"{behavior_key}:timestamps"
+
+            # Record this request and read back the history in one round trip
+            pipe = self.redis_client.pipeline()
+            for key, value in ((path_ids_key, self._path_id(path)), (methods_key, method),
+                               (timestamps_key, now.isoformat())):
+                pipe.lpush(key, value)
+                pipe.ltrim(key, 0, BEHAVIOR_HISTORY_SIZE - 1)
+                pipe.expire(key, 3600)  # Expire after 1 hour
+            pipe.lrange(path_ids_key, 0, -1)
+            pipe.lrange(methods_key, 0, -1)
+            *_, path_ids, methods = await pipe.execute()
+
+            path_ids = np.frombuffer(b''.join(path_ids), dtype=np.uint32)
+            unique_path_count = np.unique(path_ids).size
 
             # Analyze for anomalies
             anomalous = False
@@ -383,36 +554,28 @@ class EnhancedDetection:
             reason = ""
 
             # Check for unusual path patterns
-            if len(behavior_history['paths']) > 10:
-                unique_paths = set(behavior_history['paths'])
-                if len(unique_paths) / len(behavior_history['paths']) < 0.1:  # Very repetitive
+            if path_ids.size > 10:
+                if unique_path_count / path_ids.size < 0.1:  # Very repetitive
                     anomalous = True
                     confidence = 0.7
                     reason = "Unusual repetitive behavior detected"
 
             # Check for rapid path changes
-            if len(behavior_history['paths']) > 5:
-                recent_paths = behavior_history['paths'][-5:]
-                if len(set(recent_paths)) == len(recent_paths):  # All different paths
+            if path_ids.size > 5:
+                recent_path_ids = path_ids[:5]
+                if np.unique(recent_path_ids).size == recent_path_ids.size:  # All different paths
                     anomalous = True
                     confidence = 0.6
                     reason = "Unusual rapid path changes detected"
 
-            # Save updated behavior
-            self.redis_client.setex(
-                behavior_key,
-                3600,  # Expire after 1 hour
-                json.dumps(behavior_history)
-            )
-
             return {
                 'anomalous': anomalous,
                 'confidence': confidence,
                 'reason': reason,
                 'behavior_summary': {
-                    'total_requests': len(behavior_history['paths']),
-                    'unique_paths': len(set(behavior_history['paths'])),
-                    'unique_methods': len(set(behavior_history['methods']))
+                    'total_requests': int(path_ids.size),
+                    'unique_paths': int(unique_path_count),
+                    'unique_methods': len(set(methods))
                 }
             }
 
@@ -420,21 +583,21 @@ class EnhancedDetection:
             self.logger.error(f"Behavioral analysis error: {e}")
             return {'anomalous': False, 'confidence': 0.0, 'reason': f'Analysis error: {str(e)}'}
 
-    def _ml_anomaly_detection(self, request_data: Dict[str, Any]) -> Dict[str, Any]:
-        """ML-based anomaly detection"""
+    def _path_id(self, path: str) -> bytes:
+        """Map a path to a stable 4-byte ID for the behavior history"""
+        return hashlib.blake2b(path.encode('utf-8', 'surrogatepass'), digest_size=4).digest()
+
+    async def _ml_anomaly_detection(self, request_data: Dict[str, Any], now: datetime) -> Dict[str, Any]:
+        """ML-based anomaly detection, batched across concurrent requests"""
         try:
             if not self.isolation_forest or not self.scaler:
                 return {'anomalous': False, 'confidence': 0.0, 'score': 0.0}
 
             # Extract features from request data
-            features = self._extract_features(request_data)
+            features = self._extract_features(request_data, now)
 
-            # Scale features
-            scaled_features = self.scaler.transform([features])
-
-            # Predict anomaly
-            anomaly_score = self.isolation_forest.decision_function(scaled_features)[0]
-            is_anomalous = self.isolation_forest.predict(scaled_features)[0] == -1
+            # Concurrent requests are coalesced and scored together
+            is_anomalous, anomaly_score = await self._ml_queue_submit(features)
 
             # Convert score to confidence (higher score = more normal)
             confidence = max(0, min(1, (anomaly_score + 0.5) / 0.5)) if is_anomalous else 0.0
@@ -443,59 +606,149 @@ class EnhancedDetection:
                 'anomalous': is_anomalous,
                 'confidence': confidence,
                 'score': float(anomaly_score),
-                'features': features
+                'features': features.tolist()
             }
 
         except Exception as e:
             self.logger.error(f"ML anomaly detection error: {e}")
             return {'anomalous': False, 'confidence': 0.0, 'score': 0.0}
 
-    def _extract_features(self, request_data: Dict[str, Any]) -> List[float]:
-        """Extract numerical features from request data for ML analysis"""
-        features = []
+    async def _ml_queue_submit(self, features: np.ndarray) -> Tuple[bool, float]:
+        """Queue a feature vector for batched scoring and wait for its prediction"""
+        # A worker left over from another (possibly closed) event loop cannot serve this one
+        if (self._ml_worker is None or self._ml_worker.done()
+                or self._ml_worker.get_loop() is not asyncio.get_running_loop()):
+            self._ml_queue = asyncio.Queue()
+            self._ml_worker = asyncio.create_task(self._ml_batch_worker(self._ml_queue))
+
+        future = asyncio.get_running_loop().create_future()
+        await self._ml_queue.put((features, future))
+        return await future
+
+    async def _ml_batch_worker(self, queue: asyncio.Queue):
+        """Collect feature vectors arriving within a short window and score them together"""
+        loop = asyncio.get_running_loop()
+
+        while True:
+            batch = [await queue.get()]
+            deadline = loop.time() + ML_BATCH_WINDOW
+
+            while len(batch) < ML_BATCH_SIZE:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+
+            futures = [future for _, future in batch]
+            try:
+                results = await self._ml_score_cached(np.vstack([features for features, _ in batch]))
+                for future, result in zip(futures, results):
+                    if not future.done():
+                        future.set_result(result)
+            except Exception as e:
+                for future in futures:
+                    if not future.done():
+                        future.set_exception(e)
+
+    async def _ml_score_cached(self, features: np.ndarray) -> List[Tuple[bool, float]]:
+        """Score a feature matrix, reusing cached predictions for repeated feature vectors"""
+        cache_keys = [self._ml_cache_key(row) for row in features]
+
+        # The cache is an optimization; scoring must not depend on Redis being reachable
+        try:
+            results = [
+                ML_CACHE_RECORD.unpack(cached) if cached else None
+                for cached in await self.redis_client.mget(cache_keys)
+            ]
+        except Exception as e:
+            self.logger.warning(f"ML cache lookup error: {e}")
+            results = [None] * len(cache_keys)
 
-        # Request characteristics
-        path = request_data.get('path', '')
-        method = request_data.get('method', '')
-        user_agent = request_data.get('user_agent', '')
-        body = request_data.get('body', '')
+        misses = [i for i, result in enumerate(results) if result is None]
+        if misses:
+            predictions, scores = await asyncio.get_running_loop().run_in_executor(
+                self.executor, self._ml_score_batch, features[misses]
+            )
 
-        # Feature 1: Path length
-        features.append(len(path))
+            pipe = self.redis_client.pipeline()
+            for i, is_anomalous, anomaly_score in zip(misses, predictions, scores):
+                results[i] = (bool(is_anomalous), float(anomaly_score))
+                pipe.setex(cache_keys[i], ML_CACHE_TTL, ML_CACHE_RECORD.pack(*results[i]))
 
-        # Feature 2: Method encoding (GET=0, POST=1, PUT=2, DELETE=3, etc.)
-        method_map = {'GET': 0, 'POST': 1, 'PUT': 2, 'DELETE': 3, 'PATCH': 4}
-        features.append(method_map.get(method, 5))
+            try:
+                await pipe.execute()
+            except Exception as e:
+                self.logger.warning(f"ML cache update error: {e}")
 
-        # Feature 3: Number of special characters in path
-        features.append(len([c for c in path if c in ['<', '>', '"', "'", '&', '%']]))
+        return results
 
-        # Feature 4: User agent length
-        features.append(len(user_agent))
+    def _ml_score_batch(self, features: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Run the scaler and isolation forest over a feature matrix"""
+        # Standardize with the fitted scaler parameters into this thread's scratch buffer
+        scaled_features = self._scaled_features_buffer()[:len(features)]
+        np.subtract(features, self._scaler_mean, out=scaled_features)
+        np.divide(scaled_features, self._scaler_scale, out=scaled_features)
 
-        # Feature 5: Body length
-        features.append(len(body))
+        if self._ort_session is not None:
+            anomaly_scores = self._ort_session.run(['scores'], {'X': scaled_features})[0].ravel()
+        else:
+            anomaly_scores = self.isolation_forest.decision_function(scaled_features)
+
+        # predict() flags exactly the samples with a negative decision score
+        return anomaly_scores < 0, anomaly_scores
+
+    def _scaled_features_buffer(self) -> np.ndarray:
+        """Per-thread scratch matrix for standardized features, reused across batches"""
+        buffer = getattr(self._tls, 'scaled_features', None)
+        if buffer is None:
+            buffer = np.empty((ML_BATCH_SIZE, FEATURE_COUNT), dtype=np.float32)
+            self._tls.scaled_features = buffer
+        return buffer
+
+    def _ml_cache_key(self, features: np.ndarray) -> bytes:
+        """Build the Redis key for cached ML results of a feature vector"""
+        if blake3 is not None:
+            digest = blake3.blake3(features.tobytes()).digest(length=16)
+        else:
+            digest = hashlib.blake2b(features.tobytes(), digest_size=16).digest()
+        return b"mlcache:" + digest
 
-        # Feature 6: Number of headers
-        features.append(len(request_data.get('headers', {})))
+    def _extract_features(self, request_data: Dict[str, Any], now: datetime) -> np.ndarray:
+        """Extract numerical features from request data for ML analysis"""
+        features = np.empty(FEATURE_COUNT, dtype=np.float32)
 
-        # Feature 7: Has authentication
-        features.append(1 if request_data.get('user_id') else 0)
+        # Request characteristics
+        path = request_data.get('path', '')
+        method = request_data.get('method', '')
+        user_agent = request_data.get('user_agent', '')
+        body = request_data.get('body', '')
+
+        # Features 1-3: path length, method encoding, special characters in path
+        features[0] = len(path)
+        features[1] = METHOD_LUT.get(method, 5)
+        features[2] = len(path) - len(path.translate(_SPECIAL_TBL))
 
-        # Feature 8: Time-based features (hour of day)
-        features.append(datetime.now().hour / 24.0)
+        # Features 4-7: user agent length, body length, header count, has authentication
+        features[3] = len(user_agent)
+        features[4] = len(body)
+        features[5] = len(request_data.get('headers', {}))
+        features[6] = 1 if request_data.get('user_id') else 0
 
-        # Feature 9: Day of week
-        features.append(datetime.now().weekday() / 7.0)
+        # Features 8-9: hour of day and day of week
+        features[7] = now.hour / 24.0
+        features[8] = now.weekday() / 7.0
 
         # Feature 10: Path entropy (measure of randomness)
-        if path:
-            from collections import Counter
-            path_chars = Counter(path.lower())
-            entropy = -sum((count/len(path)) * np.log2(count/len(path)) for count in path_chars.values())
-            features.append(entropy)
+        path_bytes = np.frombuffer(path.lower().encode('utf-8', 'ignore'), dtype=np.uint8)
+        if path_bytes.size:
+            counts = np.bincount(path_bytes)
+            probabilities = counts[counts > 0] / path_bytes.size
+            features[9] = -(probabilities * np.log2(probabilities)).sum()
         else:
-            features.append(0.0)
+            features[9] = 0.0
 
         return features
 
@@ -509,43 +762,49 @@ class EnhancedDetection:
             if not user_id:
                 return {'suspicious': False, 'reasons': [], 'confidence': 0.0}
 
-            # Check failed login attempts
             failed_login_key = f"failed_logins:{user_id}"
-            failed_count = self.redis_client.get(failed_login_key)
+            login_ip_key = f"login_ips:{user_id}"
+            rapid_login_key = f"rapid_logins:{ip}"
 
+            # Read all tracking data in one round trip
+            pipe = self.redis_client.pipeline()
+            pipe.get(failed_login_key)
+            pipe.scard(login_ip_key)
+            pipe.get(rapid_login_key)
+            failed_count, login_ip_count, recent_logins = await pipe.execute()
+
+            # Check failed login attempts
             if failed_count and int(failed_count) > self.max_failed_logins:
                 suspicious = True
-                reasons.append(f"Multiple failed login attempts: {failed_count}")
+                reasons.append(f"Multiple failed login attempts: {int(failed_count)}")
                 confidence = 0.8
 
             # Check login from different IPs
-            login_ip_key = f"login_ips:{user_id}"
-            recent_ips = self.redis_client.smembers(login_ip_key)
-
-            if len(recent_ips) > 5:  # More than 5 different IPs in recent history
+            if login_ip_count > 5:  # More than 5 different IPs in recent history
                 suspicious = True
-                reasons.append(f"Login from multiple IPs: {len(recent_ips)} different IPs")
+                reasons.append(f"Login from multiple IPs: {login_ip_count} different IPs")
                 confidence = max(confidence, 0.6)
 
             # Check rapid login attempts
-            rapid_login_key = f"rapid_logins:{ip}"
-            recent_logins = self.redis_client.get(rapid_login_key)
-
             if recent_logins and int(recent_logins) > 10:  # More than 10 logins in short time
                 suspicious = True
-                reasons.append(f"Rapid login attempts from IP: {recent_logins}")
+                reasons.append(f"Rapid login attempts from IP: {int(recent_logins)}")
                 confidence = max(confidence, 0.7)
 
             # Update tracking data
             if suspicious:
-                self.redis_client.incr(failed_login_key)
-                self.redis_client.expire(failed_login_key, 3600)  # Expire after 1 hour
+                pipe = self.redis_client.pipeline()
 
-                self.redis_client.sadd(login_ip_key, ip)
-                self.redis_client.expire(login_ip_key, 86400)  # Expire after 24 hours
+                pipe.incr(failed_login_key)
+                pipe.expire(failed_login_key, 3600)  # Expire after 1 hour
 
-                self.redis_client.incr(rapid_login_key)
-                self.redis_client.expire(rapid_login_key, 300)  # Expire after 5 minutes
+                pipe.sadd(login_ip_key, ip)
+                pipe.expire(login_ip_key, 86400)  # Expire after 24 hours
+
+                pipe.incr(rapid_login_key)
+                pipe.expire(rapid_login_key, 300)  # Expire after 5 minutes
+
+                await pipe.execute()
 
             return {
                 'suspicious': suspicious,
@@ -575,10 +834,26 @@ class EnhancedDetection:
 
     def _generate_session_id(self) -> str:
         """Generate a secure session ID"""
-        return secrets.token_hex(16)
+        if self._session_id_offset + SESSION_ID_BYTES > len(self._session_id_pool):
+            self._session_id_pool = secrets.token_bytes(SESSION_ID_POOL_SIZE)
+            self._session_id_offset = 0
+
+        offset = self._session_id_offset
+        self._session_id_offset = offset + SESSION_ID_BYTES
+        return self._session_id_pool[offset:offset + SESSION_ID_BYTES].hex()
 
-    def get_security_metrics(self) -> Dict[str, Any]:
+    async def get_security_metrics(self) -> Dict[str, Any]:
         """Get current security metrics"""
+        try:
+            pipe = self.redis_client.pipeline()
+            pipe.hgetall(METRICS_KEY)
+            pipe.pfcount('unique_ips_hll')
+            counters, unique_ips = await pipe.execute()
+            self.metrics = SecurityMetrics.from_counters(counters, unique_ips)
+        except Exception as e:
+            # Fall back to the last snapshot read from Redis
+            self.logger.error(f"Error reading security metrics: {e}")
+
         return {
             'timestamp': datetime.now().isoformat(),
             'total_requests': self.metrics.total_requests,
@@ -599,23 +874,27 @@ class EnhancedDetection:
 
     async def update_metrics(self, detection_result: DetectionResult, response_time: float):
         """Update security metrics"""
-        self.metrics.total_requests += 1
+        try:
+            # Counters live in a Redis hash so updates are atomic and shared across workers
+            pipe = self.redis_client.pipeline()
+            pipe.hincrby(METRICS_KEY, 'total_requests', 1)
 
-        if detection_result.threat_level != ThreatLevel.LOW:
-            self.metrics.suspicious_requests += 1
+            # Track unique source IPs (HyperLogLog, constant memory)
+            pipe.pfadd('unique_ips_hll', detection_result.source_ip)
 
-        if detection_result.threat_level in [ThreatLevel.HIGH, ThreatLevel.CRITICAL]:
-            self.metrics.blocked_requests += 1
+            if detection_result.threat_level != ThreatLevel.LOW:
+                pipe.hincrby(METRICS_KEY, 'suspicious_requests', 1)
 
-        # Update response time (simple moving average)
-        alpha = 0.1  # Smoothing factor
-        self.metrics.average_response_time = (
-            alpha * response_time +
-            (1 - alpha) * self.metrics.average_response_time
-        )
+            if detection_result.threat_level in [ThreatLevel.HIGH, ThreatLevel.CRITICAL]:
+                pipe.hincrby(METRICS_KEY, 'blocked_requests', 1)
+
+            # Running total; the average is derived from it and total_requests
+            pipe.hincrbyfloat(METRICS_KEY, 'response_time_total', response_time)
 
-        # Update unique IPs (simplified - in production use hyperloglog)
-        self.metrics.unique_ips = len(self.redis_client.smembers('unique_ips'))
+            await pipe.execute()
+
+        except Exception as e:
+            self.logger.error(f"Error updating security metrics: {e}")
 
     def encrypt_sensitive_data(self, data: str) -> str:
         """Encrypt sensitive data"""
@@ -625,13 +904,20 @@ class EnhancedDetection:
         """Decrypt sensitive data"""
         return self.cipher.decrypt(encrypted_data.encode()).decode()
 
-# Global instance
-detection_system = EnhancedDetection()
+# Global instance, created on first use so importing the module stays cheap
+@functools.lru_cache(maxsize=1)
+def get_detection_system() -> EnhancedDetection:
+    """Get the shared detection system, creating it on first call"""
+    return EnhancedDetection()
 
 async def analyze_request(request_data: Dict[str, Any]) -> DetectionResult:
     """Convenience function to analyze a request"""
-    return await detection_system.analyze_request(request_data)
+    return await get_detection_system().analyze_request(request_data)
+
+async def analyze_requests(batch: List[Dict[str, Any]]) -> List[DetectionResult]:
+    """Convenience function to analyze a batch of requests"""
+    return await get_detection_system().analyze_requests(batch)
 
-def get_security_metrics() -> Dict[str, Any]:
+async def get_security_metrics() -> Dict[str, Any]:
     """Get current security metrics"""
-    return detection_system.get_security_metrics()
+    return await get_detection_system().get_security_metrics()
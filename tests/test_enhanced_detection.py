@@ -0,0 +1,52 @@
+import logging
+import os
+import random
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from enhanced_detection import EnhancedDetection, REGEX_PATTERN_CATEGORIES
+
+hyperscan = pytest.importorskip('hyperscan')
+
+TOKENS = [
+    'select', 'union', 'drop', 'or 1=1', '--', '/*', 'exec', 'xp_cmdshell',
+    '<script>x</script>', 'javascript:', 'onload=', '<iframe>a</iframe>', '../', '%2e%2e/',
+    'réunion', 'sélect', 'dropé', 'éxec', 'naïve', 'über', '日本', 'привет', 'a', '1', ' ', '/'
+]
+
+
+def make_detector(use_hyperscan: bool) -> EnhancedDetection:
+    """Build a detector with only the pattern-matching state (no Redis or ML setup)"""
+    detector = EnhancedDetection.__new__(EnhancedDetection)
+    detector.logger = logging.getLogger(__name__)
+    detector.suspicious_patterns = detector._load_suspicious_patterns()
+    detector._hs_dbs = detector._compile_hyperscan_databases() if use_hyperscan else {}
+    detector._pattern_prefilters = detector._compile_pattern_prefilters()
+    return detector
+
+
+@pytest.fixture(scope='module')
+def detectors():
+    accelerated = make_detector(use_hyperscan=True)
+    assert accelerated._hs_dbs, 'Hyperscan databases failed to compile'
+    return accelerated, make_detector(use_hyperscan=False)
+
+
+def test_non_ascii_word_is_not_sql_injection(detectors):
+    for detector in detectors:
+        assert detector._match_patterns('sql_injection', '/', 'Compte rendu de la réunion') == []
+
+
+def test_hyperscan_matches_re_fallback_on_mixed_input(detectors):
+    accelerated, fallback = detectors
+    rng = random.Random(42)
+
+    for _ in range(2000):
+        path = ''.join(rng.choice(TOKENS) for _ in range(rng.randint(0, 6)))
+        body = ' '.join(rng.choice(TOKENS) for _ in range(rng.randint(0, 6)))
+        for category in REGEX_PATTERN_CATEGORIES:
+            assert accelerated._match_patterns(category, path, body) == \
+                fallback._match_patterns(category, path, body), (category, path, body)